@@ -1,7 +1,8 @@
 from mcp.server.fastmcp import FastMCP, Context
 from contextlib import asynccontextmanager
-from typing import AsyncIterator, Dict, Any, List, Optional, Union
+from typing import AsyncIterator, Awaitable, Callable, Dict, Any, List, Optional, Tuple, Union
 import asyncio
+import functools
 
 import json
 from browser_use.browser.browser import Browser, BrowserConfig, BrowserContextConfig
@@ -9,39 +10,106 @@ from browser_use.browser.context import BrowserContext
 from browser_use.controller.service import Controller
 from browser_use.agent.views import ActionResult
 
+import os
 import sys
+import types
+import inspect
 import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
-# Use the right import for StreamHandler
-# StreamHandler is in the main logging module, not in logging.handlers
-# from logging.handlers import StreamHandler  # This is incorrect
-# Instead, use:
+_logging_configured = False
 
-# Configure a custom stderr handler for all logging
-stderr_handler = logging.StreamHandler(sys.stderr)  # This is correct
-stderr_handler.setFormatter(logging.Formatter("%(levelname)-8s [%(name)s] %(message)s"))
 
-# Get the root logger and remove any existing handlers
-root_logger = logging.getLogger()
-root_logger.handlers = []
-root_logger.addHandler(stderr_handler)
-root_logger.setLevel(logging.INFO)
+def _configure_logging() -> None:
+    """Route all logging to stderr so stdout stays free for the stdio transport.
+
+    Only the first call has any effect.
+    """
+    global _logging_configured
+    if _logging_configured:
+        return
+
+    # Configure a custom stderr handler for all logging
+    stderr_handler = logging.StreamHandler(sys.stderr)
+    stderr_handler.setFormatter(logging.Formatter("%(levelname)-8s [%(name)s] %(message)s"))
+
+    # Get the root logger and remove any existing handlers
+    root_logger = logging.getLogger()
+    root_logger.handlers = []
+    root_logger.addHandler(stderr_handler)
+    root_logger.setLevel(logging.INFO)
+
+    # Force all loggers from third-party libraries to use stderr too
+    for third_party_logger_name in [
+        "playwright", "httpx", "selenium", "asyncio", "browser_use",
+        "mcp", "langchain", "openai", "anthropic"
+    ]:
+        third_party_logger = logging.getLogger(third_party_logger_name)
+        third_party_logger.handlers = []
+        third_party_logger.addHandler(stderr_handler)
+        if third_party_logger.level != logging.WARNING:
+            third_party_logger.setLevel(logging.WARNING)  # Only show warnings and errors
+        third_party_logger.propagate = False  # Don't propagate to root logger
+
+    _logging_configured = True
+
+
+_configure_logging()
 
 # Create our specific logger
 logger = logging.getLogger("browser-agent")
 
-# Force all loggers from third-party libraries to use stderr too
-for third_party_logger_name in [
-    "playwright", "httpx", "selenium", "asyncio", "browser_use", 
-    "mcp", "langchain", "openai", "anthropic"
-]:
-    third_party_logger = logging.getLogger(third_party_logger_name)
-    third_party_logger.handlers = []
-    third_party_logger.addHandler(stderr_handler)
-    third_party_logger.setLevel(logging.WARNING)  # Only show warnings and errors
-    third_party_logger.propagate = False  # Don't propagate to root logger
+
+def _json_dumps(obj: Any, indent: bool = False) -> str:
+    """Serialize to JSON with orjson when installed, else the stdlib encoder"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None).decode()
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def _lighten_playwright_stack_capture() -> None:
+    """Replace the inspect.stack() call Playwright makes on every API call.
+
+    Playwright walks the caller's stack to name the public API method
+    (apiName). It uses that name to prefix rewritten errors, e.g.
+    "Page.goto: Timeout ...", and to decide whether a call is marked
+    internal. It reads only each frame's filename, line number and frame
+    object, so the frames are built straight from the frame objects. This
+    skips source file resolution and context-line reads from linecache.
+    """
+    try:
+        from playwright._impl import _connection
+    except ImportError:
+        logger.warning("Playwright internals not found, keeping inspect.stack() capture")
+        return
+
+    class _LightStackInspect(types.ModuleType):
+        def __getattr__(self, name: str) -> Any:
+            return getattr(inspect, name)
+
+        @staticmethod
+        def stack(context: int = 1) -> List[inspect.FrameInfo]:
+            frames = []
+            frame = sys._getframe(1)
+            while frame is not None:
+                code = frame.f_code
+                frames.append(inspect.FrameInfo(frame, code.co_filename, frame.f_lineno, code.co_name, None, None))
+                frame = frame.f_back
+            return frames
+
+    _connection.inspect = _LightStackInspect("inspect")
+
+
+# Set PW_INSPECT_STACK=0 to use the lighter stack capture for Playwright calls
+if os.environ.get("PW_INSPECT_STACK") == "0":
+    _lighten_playwright_stack_capture()
 
 
 CHROME_BROWSER = "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"
@@ -69,23 +137,62 @@ async def browser_lifespan(server: FastMCP) -> AsyncIterator[Dict[str, Any]]:
             ),
 	    )
     )
-    browser_context = await browser.new_context()
     controller = Controller()
+    # The registry is static for the life of the server, so build the
+    # ActionModel class and the action descriptions once instead of on
+    # every tool call
+    action_model = controller.registry.create_action_model()
+    prompt_description = controller.registry.get_prompt_description()
     
+    browser_context: Optional[BrowserContext] = None
     try:
+        browser_context = await browser.new_context()
+        # Open the page now so the Playwright driver, browser launch and CDP
+        # session are paid for at startup instead of on the first tool call
+        await browser_context.get_current_page()
+        
         yield {
             "browser": browser,
             "browser_context": browser_context,
-            "controller": controller
+            "browser_context_lock": asyncio.Lock(),
+            "controller": controller,
+            "ActionModel": action_model,
+            "prompt_description": prompt_description
         }
     finally:
-        await browser_context.close()
+        if browser_context is not None:
+            await browser_context.close()
         await browser.close()
 
+def tool_errors(label: str) -> Callable[[Callable[..., Awaitable[str]]], Callable[..., Awaitable[str]]]:
+    """Log and return tool exceptions as an "Error <label>: ..." string"""
+    def decorator(fn: Callable[..., Awaitable[str]]) -> Callable[..., Awaitable[str]]:
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> str:
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                logger.error("Error %s: %s", label, e)
+                return f"Error {label}: {e}"
+        return wrapper
+    return decorator
+
+@asynccontextmanager
+async def checkout_browser_context(ctx: Context) -> AsyncIterator[BrowserContext]:
+    """Hold the browser context exclusively for the duration of a tool call.
+    
+    The stdio transport has a single client, so one context is shared by
+    every call. The lock keeps a planner snapshot from interleaving with an
+    action sequence on the same page.
+    """
+    async with ctx.request_context.lifespan_context["browser_context_lock"]:
+        yield ctx.request_context.lifespan_context["browser_context"]
+
 # Initialize FastMCP server
 mcp = FastMCP("browser-agent", lifespan=browser_lifespan)
 
 @mcp.tool()
+@tool_errors("getting planner state")
 async def get_planner_state(ctx: Context) -> str:
     """Get the current browser state and planning context.
     This tool must be executed before execute_actions tool.
@@ -103,31 +210,31 @@ async def get_planner_state(ctx: Context) -> str:
         ]
     }
     """
-    browser_context = ctx.request_context.lifespan_context["browser_context"]
-    controller = ctx.request_context.lifespan_context["controller"]
-    
-    try:
+    async with checkout_browser_context(ctx) as browser_context:
         state = await browser_context.get_state()
-        elements_text = state.element_tree.clickable_elements_to_string()
-        
-        # Get available actions from the controller's registry
-        available_actions = controller.registry.get_prompt_description()
-        
-        # Format the response according to system prompt
-        response = {
-            "current_state": {
-                "evaluation_previous_goal": "Unknown - No previous actions to evaluate",
-                "memory": "Starting new browser session",
-                "next_goal": "Ready to execute browser actions"
-            },
-            "action": []  # Empty action list - actions will be specified by the caller
-        }
-        
-        # Add browser state information
-        state_info = f"""
+    # The element tree walk is synchronous, run it off the event loop
+    elements_text = await asyncio.to_thread(state.element_tree.clickable_elements_to_string)
+    
+    # Available actions from the controller's registry, cached at startup
+    available_actions = ctx.request_context.lifespan_context["prompt_description"]
+    
+    # Format the response according to system prompt
+    response = {
+        "current_state": {
+            "evaluation_previous_goal": "Unknown - No previous actions to evaluate",
+            "memory": "Starting new browser session",
+            "next_goal": "Ready to execute browser actions"
+        },
+        "action": []  # Empty action list - actions will be specified by the caller
+    }
+    
+    tabs = _json_dumps([tab.model_dump(mode="json") for tab in state.tabs])
+    
+    # Add browser state information
+    state_info = f"""
 Current URL: {state.url}
 Title: {state.title}
-Available tabs: {[tab.model_dump() for tab in state.tabs]}
+Available tabs: {tabs}
 Interactive elements:
 {elements_text}
 
@@ -143,12 +250,34 @@ Note: Actions should be executed using the execute_actions tool with the followi
     }}
 }}
 """
-        return json.dumps(response, indent=2) + "\n\nBrowser State:\n" + state_info
-    except Exception as e:
-        logger.error(f"Error getting planner state: {str(e)}")
-        return f"Error getting planner state: {str(e)}"
+    return _json_dumps(response, indent=True) + "\n\nBrowser State:\n" + state_info
+
+def _parse_action(action_dict: Any) -> Optional[Tuple[str, Any]]:
+    """Split an action into its name and params.
+    
+    Accepts both the planner format {"action_name": {...}} and the
+    {"name": "action_name", "params": {...}} format advertised by
+    get_planner_state. Returns None if the action matches neither.
+    """
+    if not isinstance(action_dict, dict):
+        return None
+    if len(action_dict) == 1:
+        action_name = next(iter(action_dict))
+        return action_name, action_dict[action_name]
+    if action_dict.keys() == {"name", "params"} and isinstance(action_dict["name"], str):
+        return action_dict["name"], action_dict["params"]
+    return None
+
+def _format_result(result: ActionResult) -> str:
+    """Render an action result as the text returned to the client"""
+    if result.extracted_content:
+        return result.extracted_content
+    if result.error:
+        return f"Error: {result.error}"
+    return "Action executed successfully"
 
 @mcp.tool()
+@tool_errors("executing actions")
 async def execute_actions(actions: Dict[str, Any], ctx: Context) -> str:
     """Execute actions from the planner state.
     
@@ -169,76 +298,80 @@ async def execute_actions(actions: Dict[str, Any], ctx: Context) -> str:
     Note: If the page state changes (new elements appear) during action execution,
     the sequence will be interrupted and you'll need to get a new planner state.
     """
-    browser_context = ctx.request_context.lifespan_context["browser_context"]
     controller = ctx.request_context.lifespan_context["controller"]
+    ActionModel = ctx.request_context.lifespan_context["ActionModel"]
     
-    try:
-        # Validate input format
-        if not isinstance(actions, dict) or "action" not in actions:
-            return "Error: Actions must be a dictionary containing 'action' list"
-            
-        action_list = actions["action"]
-        if not action_list:
-            return "No actions to execute"
-            
-        # Get initial state for DOM change detection
-        initial_state = await browser_context.get_state()
-        initial_path_hashes = set(e.hash.branch_path_hash for e in initial_state.selector_map.values())
+    # Validate input format
+    if not isinstance(actions, dict) or "action" not in actions:
+        return "Error: Actions must be a dictionary containing 'action' list"
         
-        # Convert system prompt action format to action models
-        action_models = []
-        for action_dict in action_list:
-            if not isinstance(action_dict, dict) or len(action_dict) != 1:
-                return "Error: Each action must be a dictionary with exactly one key-value pair"
-                
-            action_name = list(action_dict.keys())[0]
-            params = action_dict[action_name]
-            
-            # Create action model using the controller's registry
-            action_model = controller.registry.create_action_model()(**{action_name: params})
-            action_models.append(action_model)
+    action_list = actions["action"]
+    if not action_list:
+        return "No actions to execute"
+        
+    # Convert system prompt action format to action models, validating the
+    # whole sequence (including params) before any action touches the page
+    action_models = []
+    requires_elements = []
+    for i, action_dict in enumerate(action_list, start=1):
+        parsed = _parse_action(action_dict)
+        if parsed is None:
+            return f"Error: Action {i} must be a dictionary with exactly one key-value pair or 'name' and 'params' keys"
+        action_name, params = parsed
         
+        # Create action model using the cached registry model class
+        action_models.append(ActionModel(**{action_name: params}))
+        # Track which actions target an element on the page
+        requires_elements.append(
+            isinstance(params, dict) and any(key in params for key in ("index", "xpath"))
+        )
+    
+    # The DOM is only checked before an element-targeting action that follows
+    # another action, so read-only sequences skip state polling entirely
+    needs_dom_tracking = any(requires_elements[1:])
+    
+    async with checkout_browser_context(ctx) as browser_context:
+        # Get initial state for DOM change detection
+        if needs_dom_tracking:
+            initial_state = await browser_context.get_state()
+            initial_path_hashes = frozenset([e.hash.branch_path_hash for e in initial_state.selector_map.values()])
+    
         # Execute actions one by one to check for DOM changes
         results = []
         for i, action_model in enumerate(action_models):
             # Execute single action
             result = await controller.act(action_model, browser_context)
             results.append(result)
-            
-            # Check if this action requires element interaction
-            requires_elements = any(param in str(action_model) for param in ["index", "xpath"])
-            
-            # If not the last action and next action might need elements, check for DOM changes
-            if i < len(action_models) - 1:
+            # Let clients that sent a progress token follow long sequences
+            await ctx.report_progress(i + 1, len(action_models))
+        
+            # Stop if there was an error
+            if result.error:
+                break
+        
+            # Only re-read the page when the next action targets an element
+            if i < len(action_models) - 1 and requires_elements[i + 1]:
                 new_state = await browser_context.get_state()
-                new_path_hashes = set(e.hash.branch_path_hash for e in new_state.selector_map.values())
-                
-                # If DOM changed and next action needs elements, break sequence
-                if requires_elements and not new_path_hashes.issubset(initial_path_hashes):
+            
+                # If DOM changed and next action needs elements, break sequence.
+                # Stops at the first new element instead of hashing the whole page.
+                if any(
+                    e.hash.branch_path_hash not in initial_path_hashes
+                    for e in new_state.selector_map.values()
+                ):
                     msg = f"Page state changed after action {i + 1}/{len(action_models)}. Please get new planner state before continuing."
                     logger.info(msg)
                     results.append(ActionResult(extracted_content=msg, include_in_memory=True))
                     break
-            
-            # Stop if there was an error
-            if result.error:
-                break
-        
-        # Process results
-        output = []
-        for result in results:
-            if result.extracted_content:
-                output.append(result.extracted_content)
-            elif result.error:
-                output.append(f"Error: {result.error}")
-            else:
-                output.append("Action executed successfully")
-                
-        return "\n".join(output)
-    except Exception as e:
-        logger.error(f"Error executing actions: {str(e)}")
-        return f"Error executing actions: {str(e)}"
+    
+    return "\n".join([_format_result(result) for result in results])
 
 # Start the server
 if __name__ == "__main__":
-    mcp.run(transport='stdio')
\ No newline at end of file
+    # Prefer uvloop's libuv-based event loop where it is available
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+    mcp.run(transport='stdio')